@@ -1,7 +1,11 @@
 import asyncio
+import hashlib
 import sys
 import os
+import secrets
+import time
 import jwt
+import orjson
 from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime, timedelta
@@ -10,11 +14,14 @@ from datetime import datetime, timedelta
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.middleware.gzip import GZipMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError, PyMongoError
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from dotenv import load_dotenv
@@ -23,32 +30,211 @@ from dotenv import load_dotenv
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# ⚠️ KEEP A FIXED KEY so users stay logged in
-SECRET_KEY = "flippy_bird_super_secret_key_forever"
+# Rotating JWT_SECRET only voids outstanding access tokens: refresh tokens live in the DB,
+# so clients just call /auth/refresh. Required: crash at import rather than sign with no key
+SECRET_KEY = os.environ["JWT_SECRET"]
 ALGORITHM = "HS256"
+ACCESS_TOKEN_TTL = timedelta(minutes=15)
+ACCESS_TOKEN_LEEWAY = 60 # seconds of clock skew allowed on exp
+REFRESH_TOKEN_TTL = timedelta(days=365) # sliding: every refresh issues a new one
+TOKEN_CACHE_SIZE = 10_000
+TOKEN_CACHE_TTL = 300 # seconds
+LEADERBOARD_CACHE_TTL = 3 # seconds
+SCORE_QUEUE_SIZE = 10_000
+SCORE_BATCH_SIZE = 500
+SCORE_FLUSH_INTERVAL = 0.2 # seconds
+SCORE_WRITE_RETRIES = 5
 MONGO_URI = os.getenv("MONGO_URI")
-
-client = None
-db = None
+# Comma-separated; defaults cover the Capacitor app webview (iOS + Android)
+CORS_ORIGINS = [
+    o.strip()
+    for o in os.getenv("CORS_ORIGINS", "capacitor://localhost,http://localhost,https://localhost").split(",")
+    if o.strip()
+]
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global client, db
+    # Created here, never at import: each worker process opens its own Motor client
     print("🚀 Connecting to DB...")
+    client = AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=50,
+        minPoolSize=5, # keep a few warm so bursts don't pay the TLS handshake
+        serverSelectionTimeoutMS=3000, # fail fast instead of hanging requests
+        connectTimeoutMS=3000,
+        waitQueueTimeoutMS=2000,
+        retryWrites=True,
+        # zstd via pymongo[zstd]; zlib (stdlib) is the fallback for servers without it
+        compressors="zstd,zlib"
+    )
+    db = client.flippybird_db
     try:
-        client = AsyncIOMotorClient(MONGO_URI)
-        db = client.flippybird_db
         await client.admin.command('ping')
         print("✅ DB Connected!")
+        await create_indexes(db)
+        await backfill_week_best(db)
     except Exception as e:
+        # Don't serve without a database
         print(f"❌ DB Error: {e}")
+        client.close()
+        raise
+    app.state.db = db
+    writer = asyncio.create_task(score_writer(db))
     yield
-    if client: client.close()
+    # Flush whatever is still queued before closing the connection
+    # (if the writer is gone, nobody would take the sentinel and put() could block forever)
+    if not writer.done():
+        await score_queue.put(None)
+        await writer
+    client.close()
+
+# Case-insensitive match ("Joel" == "joel") for usernames
+USERNAME_COLLATION = {"locale": "en", "strength": 2}
+
+def week_of(ts: datetime) -> str:
+    # ISO week, e.g. "2026-W42"; the leaderboard resets every Monday 00:00 UTC
+    return ts.strftime("%G-W%V")
+
+async def ensure_unique_index(coll, field: str, collation=None):
+    # Older code let duplicates in (regex name check, find-then-insert race). Building
+    # the unique index over them fails with a raw duplicate-key error, so check first
+    # and say exactly what has to be cleaned up.
+    if f"{field}_1" not in await coll.index_information():
+        dupes = await coll.aggregate([
+            {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": 10}
+        ], collation=collation).to_list(10)
+        if dupes:
+            raise RuntimeError(
+                f"Can't create unique index on {coll.name}.{field}"
+                f"{' (case-insensitive)' if collation else ''}: duplicate values "
+                f"{[d['_id'] for d in dupes]}. Rename or merge those {coll.name} "
+                f"documents, then restart."
+            )
+    await coll.create_index([(field, 1)], collation=collation, unique=True)
+
+async def create_indexes(db: AsyncIOMotorDatabase):
+    # Raw score history only needs to outlive the current week
+    await db.scores.create_index("timestamp", expireAfterSeconds=7 * 86400)
+    await ensure_unique_index(db.users, "device_id")
+    await ensure_unique_index(db.users, "username", collation=USERNAME_COLLATION)
+    # Leaderboard reads this week's players sorted by their best score
+    await db.users.create_index([("week", 1), ("week_best", -1)])
+    # Refresh tokens are looked up by hash and dropped by Mongo once expired
+    await db.refresh_tokens.create_index("token_hash", unique=True)
+    # One live refresh token per device: issuing a new one revokes the old
+    await db.refresh_tokens.create_index("device_id", unique=True)
+    await db.refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+    print("✅ Indexes ready")
+
+async def backfill_week_best(db: AsyncIOMotorDatabase):
+    # One-off: users created before week_best existed get it from this week's scores
+    if await db.users.find_one({"week": {"$exists": True}}, {"_id": 1}):
+        return
+    now = datetime.utcnow()
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    await db.scores.aggregate([
+        # Filter first so only this week's rows reach the group (uses the timestamp index)
+        {"$match": {"timestamp": {"$gte": week_start}}},
+        {"$group": {"_id": "$device_id", "week_best": {"$max": "$score"}}},
+        {"$project": {"_id": 0, "device_id": "$_id", "week": week_of(now), "week_best": 1}},
+        {"$merge": {"into": "users", "on": "device_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ]).to_list(None)
+    print("✅ Weekly best scores backfilled")
+
+# --- SCORE WRITER ---
+# Submitted scores are queued and written in batches, so the client never waits on Mongo
+score_queue = asyncio.Queue(maxsize=SCORE_QUEUE_SIZE)
+
+async def retry_transient(what, op):
+    # Rides out short outages (failover, the 3s server-selection timeout) with backoff
+    for attempt in range(SCORE_WRITE_RETRIES):
+        try:
+            return await op()
+        except AutoReconnect as e: # includes ServerSelectionTimeoutError / NetworkTimeout
+            if attempt == SCORE_WRITE_RETRIES - 1:
+                raise
+            print(f"⚠️ {what} failed ({e}), retrying")
+            await asyncio.sleep(min(0.5 * 2 ** attempt, 5))
+
+async def flush_scores(db: AsyncIOMotorDatabase, batch):
+    # The client was already told "Score saved", so nothing here may give up silently
+    try:
+        await retry_transient("Score insert", lambda: db.scores.insert_many(batch, ordered=False))
+    except BulkWriteError as e:
+        # Unordered: every row not listed here went in. Duplicate keys are rows
+        # that an earlier, interrupted attempt had already written.
+        errors = [w for w in e.details["writeErrors"] if w["code"] != 11000]
+        if errors:
+            print(f"❌ Dropped {len(errors)} of {len(batch)} score records: {errors[0]['errmsg']}")
+    except PyMongoError as e:
+        print(f"❌ Lost {len(batch)} score records: {e!r}")
+
+    # The leaderboard update stands on its own: a failed history insert shouldn't hide the score
+    # One update per device, for the newest week in the batch (a batch can span Monday 00:00)
+    best = {}
+    for s in batch:
+        week = week_of(s["timestamp"])
+        prev = best.get(s["device_id"])
+        if prev is None or week > prev[0]:
+            best[s["device_id"]] = (week, s["score"])
+        elif week == prev[0]:
+            best[s["device_id"]] = (week, max(s["score"], prev[1]))
+    # A score from a new week replaces the stale week_best instead of competing with it.
+    # "week" only ever moves forward (ISO week strings compare correctly as text), so a
+    # late-flushed score from last week can't pull a player off the current board.
+    updates = [
+        UpdateOne({"device_id": d}, [{"$set": {
+            "week_best": {"$switch": {"branches": [
+                {"case": {"$gt": ["$week", week]}, "then": "$week_best"},
+                {"case": {"$eq": ["$week", week]}, "then": {"$max": ["$week_best", sc]}}
+            ], "default": sc}},
+            "week": {"$cond": [{"$gt": ["$week", week]}, "$week", week]}
+        }}])
+        for d, (week, sc) in best.items()
+    ]
+    try:
+        # Each update only ever keeps the newer week and the higher score, so re-applying
+        # one that already went in changes nothing: retrying a half-applied batch is safe
+        await retry_transient("Leaderboard update", lambda: db.users.bulk_write(updates, ordered=False))
+    except PyMongoError as e:
+        print(f"❌ Lost leaderboard updates for {len(updates)} players: {e!r}")
+
+async def score_writer(db: AsyncIOMotorDatabase):
+    loop = asyncio.get_running_loop()
+    while True:
+        # Never let one bad batch kill the writer: the queue would fill and every submit 503
+        try:
+            item = await score_queue.get()
+            if item is None: # shutdown
+                return
+            batch = [item]
+            deadline = loop.time() + SCORE_FLUSH_INTERVAL
+            # Keep collecting until the batch is full or the flush interval is up
+            while len(batch) < SCORE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(score_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    await flush_scores(db, batch)
+                    return
+                batch.append(item)
+            await flush_scores(db, batch)
+        except Exception as e:
+            print(f"❌ Score writer error: {e!r}")
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    return request.app.state.db
+
 # --- MODELS ---
 
 class UserInit(BaseModel):
@@ -58,6 +244,9 @@ class UserInit(BaseModel):
 class ScoreSubmit(BaseModel):
     score: int
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class LeaderboardEntry(BaseModel):
     username: str
     score: int
@@ -66,115 +255,239 @@ class LeaderboardEntry(BaseModel):
 # --- AUTH ROUTES ---
 
 @api_router.post("/auth/init")
-async def initialize_user(data: UserInit):
-    if db is None: 
-        return JSONResponse(status_code=500, content={"detail": "Database not connected"})
-
-    # --- 🔒 SECURITY STEP 1: Check if Name is Taken ---
-    # We search case-insensitive ("Joel" == "joel")
-    existing_name_user = await db.users.find_one(
-        {"username": {"$regex": f"^{data.username}$", "$options": "i"}}
-    )
+async def initialize_user(data: UserInit, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # --- STEP 1: Create-or-fetch this device in ONE round-trip ---
+    # $setOnInsert only writes for a brand new device; an existing profile is left untouched.
+    # The unique (case-insensitive) username index rejects a name owned by another device.
+    try:
+        existing_device_user = await db.users.find_one_and_update(
+            {"device_id": data.device_id},
+            {"$setOnInsert": {
+                "device_id": data.device_id,
+                "username": data.username, # We save the exact casing they typed
+                "created_at": datetime.utcnow()
+            }},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE # None means we just created it
+        )
+    except DuplicateKeyError as e:
+        # Only the username index means "taken"; anything else is a real error
+        # (older servers don't report keyPattern, and username is then the only candidate)
+        if "username" not in (e.details or {}).get("keyPattern", {"username": 1}):
+            raise
+        # 🛑 STOP: Different device trying to use an existing name
+        return ORJSONResponse(
+            status_code=403,
+            content={"detail": "Username taken! Please choose another."}
+        )
 
-    if existing_name_user:
-        # The name exists. Now, IS IT YOU?
-        if existing_name_user["device_id"] != data.device_id:
-            # 🛑 STOP: Different device trying to use an existing name
-            return JSONResponse(
-                status_code=403, 
-                content={"detail": "Username taken! Please choose another."}
-            )
-        
-        # ✅ SUCCESS: It is you (re-install or same phone)
-        token = create_token(data.device_id, existing_name_user["username"])
+    # --- STEP 2: Brand New User ---
+    if existing_device_user is None:
         return {
-            "message": "Welcome back",
-            "access_token": token,
-            "username": existing_name_user["username"],
-            "new_user": False
+            "message": "Profile created",
+            **await issue_tokens(db, data.device_id, data.username),
+            "username": data.username,
+            "new_user": True
         }
 
-    # --- SECURITY STEP 2: Check if Device already has a DIFFERENT name ---
-    # (Optional: Prevent one phone from creating 100 accounts)
-    existing_device_user = await db.users.find_one({"device_id": data.device_id})
-    
-    if existing_device_user:
-        # You are 'Device 123' trying to be 'Mark', but you are already 'Joel'
-        # We just log you in as your ORIGINAL name 'Joel'
-        token = create_token(data.device_id, existing_device_user["username"])
+    username = existing_device_user["username"]
+
+    # ✅ SUCCESS: It is you (re-install or same phone)
+    if username.casefold() == data.username.casefold():
         return {
-            "message": "Restored previous account",
-            "access_token": token,
-            "username": existing_device_user["username"],
+            "message": "Welcome back",
+            **await issue_tokens(db, data.device_id, username),
+            "username": username,
             "new_user": False
         }
 
-    # --- STEP 3: Brand New User ---
-    new_user = {
-        "device_id": data.device_id,
-        "username": data.username, # We save the exact casing they typed
-        "created_at": datetime.utcnow()
+    # --- 🔒 SECURITY STEP 3: Device already has a DIFFERENT name ---
+    # Asking for someone else's name is still refused
+    # (casefold and the collation don't always agree, so never match the caller's own profile)
+    name_owner = await db.users.find_one(
+        {"username": data.username, "device_id": {"$ne": data.device_id}},
+        {"_id": 1},
+        collation=USERNAME_COLLATION
+    )
+    if name_owner:
+        return ORJSONResponse(
+            status_code=403,
+            content={"detail": "Username taken! Please choose another."}
+        )
+
+    # You are 'Device 123' trying to be 'Mark', but you are already 'Joel'
+    # We just log you in as your ORIGINAL name 'Joel'
+    return {
+        "message": "Restored previous account",
+        **await issue_tokens(db, data.device_id, username),
+        "username": username,
+        "new_user": False
     }
-    await db.users.insert_one(new_user)
-    
-    token = create_token(data.device_id, data.username)
+
+@api_router.post("/auth/refresh")
+async def refresh_tokens(data: RefreshRequest, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # Single use: the old refresh token is consumed and a new pair issued
+    stored = await db.refresh_tokens.find_one_and_delete({
+        "token_hash": hash_refresh_token(data.refresh_token),
+        "expires_at": {"$gt": datetime.utcnow()}
+    })
+    if not stored:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    user = await db.users.find_one({"device_id": stored["device_id"]}, {"username": 1})
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
     return {
-        "message": "Profile created", 
-        "access_token": token, 
-        "username": data.username,
-        "new_user": True
+        "message": "Token refreshed",
+        **await issue_tokens(db, stored["device_id"], user["username"]),
+        "username": user["username"]
     }
 
 # --- HELPERS ---
 def create_token(device_id: str, username: str):
-    expire = datetime.utcnow() + timedelta(days=3650) # 10 Years Expiry
+    # Short-lived, so cached verifications and stolen tokens both age out quickly
+    expire = datetime.utcnow() + ACCESS_TOKEN_TTL
     payload = {"sub": device_id, "name": username, "exp": expire}
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
+def hash_refresh_token(token: str):
+    # Only the hash is stored, so a DB leak doesn't hand out sessions
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_tokens(db: AsyncIOMotorDatabase, device_id: str, username: str):
+    refresh_token = secrets.token_urlsafe(32)
+    # Replaces (and so revokes) the device's previous refresh token in the same write.
+    # Stays awaited: a refresh token handed out before it is stored could be unusable.
+    await db.refresh_tokens.update_one(
+        {"device_id": device_id},
+        {"$set": {
+            "token_hash": hash_refresh_token(refresh_token),
+            "expires_at": datetime.utcnow() + REFRESH_TOKEN_TTL
+        }},
+        upsert=True
+    )
+    return {
+        "access_token": create_token(device_id, username),
+        "refresh_token": refresh_token,
+        "expires_in": int(ACCESS_TOKEN_TTL.total_seconds())
+    }
+
+class OrjsonJWT(jwt.PyJWT):
+    # PyJWT's documented hook for payload decoding; orjson is much cheaper than stdlib json
+    def _decode_payload(self, decoded):
+        try:
+            payload = orjson.loads(decoded["payload"])
+        except orjson.JSONDecodeError as e:
+            raise jwt.DecodeError(f"Invalid payload string: {e}")
+        if not isinstance(payload, dict):
+            raise jwt.DecodeError("Invalid payload string: must be a json object")
+        return payload
+
+_jwt = OrjsonJWT()
+
+# Verified tokens -> (payload, expires_at), so we skip HMAC + JSON on repeat requests
+_token_cache = {}
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    now = time.time()
+
+    cached = _token_cache.get(key)
+    if cached:
+        if now < cached[1]:
+            return cached[0]
+        del _token_cache[key]
+
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload["sub"] # Returns device_id
-    except:
+        payload = _jwt.decode(
+            token, SECRET_KEY, algorithms=[ALGORITHM],
+            options={"require": ["exp", "sub", "name"]}
+        )
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+    # Legacy 10-year tokens can't be revoked; refuse them so old clients re-run /auth/init
+    if payload["exp"] > now + ACCESS_TOKEN_TTL.total_seconds() + ACCESS_TOKEN_LEEWAY:
+        raise HTTPException(status_code=401, detail="Token expired")
+
+    # Only successful validations get cached
+    if len(_token_cache) >= TOKEN_CACHE_SIZE:
+        _token_cache.pop(next(iter(_token_cache))) # drop the oldest entry
+    _token_cache[key] = (payload, min(payload["exp"], now + TOKEN_CACHE_TTL))
+    return payload # "sub" is the device_id, "name" the username
+
 # --- SCORE ROUTES ---
 @api_router.post("/scores/submit")
-async def submit_score(data: ScoreSubmit, device_id: str = Depends(get_current_user)):
-    user = await db.users.find_one({"device_id": device_id})
-    if not user: 
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Insert score record
-    await db.scores.insert_one({
-        "device_id": device_id,
-        "username": user["username"],
-        "score": data.score,
-        "timestamp": datetime.utcnow()
-    })
+async def submit_score(data: ScoreSubmit, user: dict = Depends(get_current_user)):
+    # The token already carries who this is, so no user lookup round-trip
+    device_id = user["sub"]
+
+    # Queue score record; score_writer inserts it and bumps the player's week_best
+    try:
+        score_queue.put_nowait({
+            "device_id": device_id,
+            "username": user["name"],
+            "score": data.score,
+            "timestamp": datetime.utcnow()
+        })
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Server busy, try again")
     return {"message": "Score saved"}
 
-@api_router.get("/leaderboard/weekly")
-async def weekly_leaderboard():
-    pipeline = [
-        {"$sort": {"score": -1}},
-        # Group by Device ID to only show each player's BEST score
-        {"$group": {
-            "_id": "$device_id",
-            "username": {"$first": "$username"},
-            "score": {"$max": "$score"}
-        }},
-        {"$sort": {"score": -1}},
-        {"$limit": 50}
-    ]
-    results = await db.scores.aggregate(pipeline).to_list(50)
-    return [LeaderboardEntry(username=r["username"], score=r["score"], rank=i+1) for i, r in enumerate(results)]
+# Every client sees the same top 50, so share one result for a few seconds
+_LB_CACHE = {"ts": 0.0, "body": None}
+_lb_lock = asyncio.Lock()
+
+@api_router.get("/leaderboard/weekly", responses={200: {"model": List[LeaderboardEntry]}})
+async def weekly_leaderboard(db: AsyncIOMotorDatabase = Depends(get_db)):
+    if _LB_CACHE["body"] is not None and time.monotonic() - _LB_CACHE["ts"] < LEADERBOARD_CACHE_TTL:
+        return Response(content=_LB_CACHE["body"], media_type="application/json")
+
+    # Single-flight: concurrent misses wait for one DB query instead of each running it
+    async with _lb_lock:
+        if _LB_CACHE["body"] is not None and time.monotonic() - _LB_CACHE["ts"] < LEADERBOARD_CACHE_TTL:
+            return Response(content=_LB_CACHE["body"], media_type="application/json")
 
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+        # week_best is already each player's BEST score this week, so no per-request aggregation
+        results = await db.users.find(
+            {"week": week_of(datetime.utcnow())},
+            {"_id": 0, "username": 1, "week_best": 1}
+        ).sort("week_best", -1).limit(50).to_list(50)
+        # Plain dicts serialized once; skips pydantic validation (LeaderboardEntry is docs-only)
+        body = orjson.dumps([
+            {"username": r["username"], "score": r["week_best"], "rank": i+1} for i, r in enumerate(results)
+        ])
+
+        _LB_CACHE["ts"] = time.monotonic()
+        _LB_CACHE["body"] = body
+        return Response(content=body, media_type="application/json")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=CORS_ORIGINS,
+    allow_methods=["GET", "POST"],
+    allow_headers=["authorization", "content-type"],
+    max_age=86400 # browsers cache the preflight for a day
+)
+# Outermost, so every response (leaderboard JSON especially) is compressed on the way out
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=4)
 app.include_router(api_router)
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop + httptools (from uvicorn[standard]) are POSIX-only
+    fast_loop = sys.platform != "win32"
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop" if fast_loop else "asyncio",
+        http="httptools" if fast_loop else "h11",
+        # One process per core; WEB_CONCURRENCY overrides (e.g. on small containers)
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2)),
+    )